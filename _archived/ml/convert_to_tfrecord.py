@@ -0,0 +1,105 @@
+import os
+import pathlib
+import tensorflow as tf
+
+# Same formats image_dataset_from_directory accepts; anything else in a class folder is skipped.
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png')
+
+def list_image_files(data_dir: str, validation_split: float = 0.2, seed: int = 123):
+    """
+    Lists images in a directory that contains subfolders for each class and splits them
+    into training and validation file datasets. Returns both along with the sorted class names.
+    """
+    AUTOTUNE = tf.data.AUTOTUNE
+    data_path = pathlib.Path(data_dir)
+    class_names = sorted(item.name for item in data_path.iterdir() if item.is_dir())
+    image_count = len([
+        f for f in data_path.glob('*/*')
+        if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS
+    ])
+
+    # List image files per class and interleave the listings so directory walks overlap.
+    extension_pattern = '|'.join(ext.lstrip('.') for ext in IMAGE_EXTENSIONS)
+    class_dirs = tf.data.Dataset.from_tensor_slices([str(data_path / name) for name in class_names])
+    files = class_dirs.interleave(
+        lambda class_dir: tf.data.Dataset.list_files(class_dir + '/*', shuffle=False),
+        cycle_length=len(class_names),
+        num_parallel_calls=AUTOTUNE,
+        deterministic=True
+    )
+    files = files.filter(
+        lambda path: tf.strings.regex_full_match(tf.strings.lower(path), rf'.*\.({extension_pattern})')
+    )
+    # Fixed shuffle so the training/validation split is stable across iterations.
+    files = files.shuffle(image_count, seed=seed, reshuffle_each_iteration=False)
+    val_size = int(image_count * validation_split)
+    return files.skip(val_size), files.take(val_size), class_names
+
+def make_image_loader(class_names, img_height: int, img_width: int):
+    """
+    Returns a tf.function that reads an image file, decodes it, resizes it to
+    (img_height, img_width) as uint8 and derives its label from the parent directory.
+    """
+    @tf.function
+    def load_image(file_path):
+        # The parent directory name is the label.
+        class_name = tf.strings.split(file_path, os.sep)[-2]
+        label = tf.argmax(tf.cast(tf.equal(class_name, class_names), tf.int32))
+        raw = tf.io.read_file(file_path)
+        image = tf.cond(
+            tf.io.is_jpeg(raw),
+            lambda: tf.io.decode_jpeg(raw, channels=3, fancy_upscaling=False),
+            lambda: tf.io.decode_image(raw, channels=3, expand_animations=False)
+        )
+        image = tf.saturate_cast(tf.image.resize(image, (img_height, img_width)), tf.uint8)
+        return image, label
+
+    return load_image
+
+def write_shards(ds: tf.data.Dataset, output_dir: pathlib.Path, prefix: str, num_shards: int):
+    """
+    Serializes (image, label) pairs as tf.train.Example records spread round-robin across
+    num_shards files named <prefix>-<index>-of-<num_shards>.tfrecord.
+    """
+    writers = [
+        tf.io.TFRecordWriter(str(output_dir / f"{prefix}-{i:05d}-of-{num_shards:05d}.tfrecord"))
+        for i in range(num_shards)
+    ]
+    count = 0
+    for image, label in ds.as_numpy_iterator():
+        example = tf.train.Example(features=tf.train.Features(feature={
+            'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+            'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)]))
+        }))
+        writers[count % num_shards].write(example.SerializeToString())
+        count += 1
+    for writer in writers:
+        writer.close()
+    return count
+
+def main():
+    # Dataset configuration. Image size must match the one used in train_model.py.
+    data_dir = "/dataset"
+    output_dir = pathlib.Path("/dataset_tfrecord")
+    img_height = 224
+    img_width = 224
+    validation_split = 0.2
+    seed = 123
+    num_shards = 256
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    train_files, val_files, class_names = list_image_files(data_dir, validation_split, seed)
+    (output_dir / "class_names.txt").write_text("\n".join(class_names) + "\n")
+    print("Detected classes:", class_names)
+
+    load_image = make_image_loader(class_names, img_height, img_width)
+    for prefix, files in (("train", train_files), ("val", val_files)):
+        # Avoid empty shards on small datasets.
+        file_count = int(files.reduce(0, lambda n, _: n + 1))
+        shards = max(1, min(num_shards, file_count))
+        ds = files.map(load_image, num_parallel_calls=tf.data.AUTOTUNE)
+        count = write_shards(ds, output_dir, prefix, shards)
+        print(f"Wrote {count} {prefix} images to {shards} shards in {output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,101 @@
-import tensorflow as tf
+import os
 import pathlib
+import tensorflow as tf
 import matplotlib.pyplot as plt
 
-def get_datasets(data_dir: str, img_height: int, img_width: int, batch_size: int,
-                 validation_split: float = 0.2, seed: int = 123):
+def get_datasets(tfrecord_dir: str):
     """
-    Loads training and validation datasets from a directory that contains subfolders for each class.
+    Loads training and validation datasets from the sharded TFRecords written by convert_to_tfrecord.py.
+    Records are returned unbatched and still serialized so configure_dataset can cache and shuffle them
+    per example before parsing.
+    Returns the two datasets along with the class names.
     """
-    data_path = pathlib.Path(data_dir)
-    train_ds = tf.keras.preprocessing.image_dataset_from_directory(
-        data_path,
-        validation_split=validation_split,
-        subset="training",
-        seed=seed,
-        image_size=(img_height, img_width),
-        batch_size=batch_size
-    )
-    val_ds = tf.keras.preprocessing.image_dataset_from_directory(
-        data_path,
-        validation_split=validation_split,
-        subset="validation",
-        seed=seed,
-        image_size=(img_height, img_width),
-        batch_size=batch_size
-    )
-    return train_ds, val_ds
+    AUTOTUNE = tf.data.AUTOTUNE
+    record_path = pathlib.Path(tfrecord_dir)
+    class_names = (record_path / "class_names.txt").read_text().splitlines()
+
+    def build(prefix):
+        files = tf.data.Dataset.list_files(str(record_path / f"{prefix}-*.tfrecord"), shuffle=False)
+        return files.interleave(tf.data.TFRecordDataset, cycle_length=AUTOTUNE,
+                                num_parallel_calls=AUTOTUNE)
 
-def configure_dataset(ds: tf.data.Dataset, shuffle: bool = True):
+    return build("train"), build("val"), class_names
+
+def make_batch_parser(img_height: int, img_width: int):
+    """
+    Returns a tf.function that parses a batch of serialized records into (images, labels).
+    Images are stored pre-decoded and pre-resized, so no JPEG decoding happens during training.
     """
-    Configures the dataset for performance with caching and prefetching.
+    feature_description = {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64)
+    }
+
+    @tf.function
+    def parse_batch(records):
+        # Parse whole batches at once. Images stay uint8; Rescaling casts them to float32.
+        features = tf.io.parse_example(records, feature_description)
+        images = tf.io.decode_raw(features['image'], tf.uint8)
+        images = tf.reshape(images, [-1, img_height, img_width, 3])
+        return images, features['label']
+
+    return parse_batch
+
+def configure_dataset(ds: tf.data.Dataset, batch_size: int, parse_batch, shuffle: bool = True,
+                      data_augmentation=None, shuffle_buffer: int = 1000, cache_path: str = ""):
+    """
+    Configures a dataset of serialized records for performance with caching, batching and prefetching.
+    Records are cached before shuffling, and shuffled per example, so every epoch sees new batches.
+    shuffle_buffer counts examples. Pass cache_path to cache to disk instead of memory when the
+    dataset does not fit in RAM.
+    Parsing, rescaling and optional augmentation run on whole batches after caching.
     """
     AUTOTUNE = tf.data.AUTOTUNE
+    ds = ds.cache(cache_path)
     if shuffle:
-        ds = ds.shuffle(1000)
-    return ds.cache().prefetch(buffer_size=AUTOTUNE)
-
-def build_model(input_shape, num_classes, data_augmentation=None):
+        ds = ds.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size, num_parallel_calls=AUTOTUNE)
+    ds = ds.map(parse_batch, num_parallel_calls=AUTOTUNE)
+
+    # Normalize pixel values to [-1, 1], the range MobileNetV3 was trained on.
+    # Runs on the CPU input threads, so keep it in float32 regardless of the mixed precision policy.
+    rescale = tf.keras.layers.Rescaling(1.0 / 127.5, offset=-1, dtype='float32')
+    # Rescale before augmenting so the augmentation layers always see float32 input.
+    if data_augmentation is not None:
+        ds = ds.map(lambda x, y: (data_augmentation(rescale(x), training=True), y),
+                    num_parallel_calls=AUTOTUNE)
+    else:
+        ds = ds.map(lambda x, y: (rescale(x), y), num_parallel_calls=AUTOTUNE)
+
+    # Enable tf.data graph optimizations and give the pipeline its own threads.
+    options = tf.data.Options()
+    options.autotune.enabled = True
+    options.experimental_optimization.map_parallelization = True
+    options.experimental_optimization.map_and_batch_fusion = True
+    options.experimental_optimization.parallel_batch = True
+    options.threading.private_threadpool_size = os.cpu_count()
+    ds = ds.with_options(options)
+    return ds.prefetch(buffer_size=AUTOTUNE)
+
+def build_model(input_shape, num_classes):
     """
-    Constructs a CNN model using data augmentation and normalization layers.
+    Constructs a classifier on top of a frozen, ImageNet-pretrained MobileNetV3Small backbone.
+    Inputs are expected to be rescaled to [-1, 1] by configure_dataset.
     """
-    model = tf.keras.Sequential()
-    # Optional: apply data augmentation if provided.
-    if data_augmentation:
-        model.add(data_augmentation)
-    # Normalize pixel values to [0, 1].
-    model.add(tf.keras.layers.Rescaling(1.0 / 255, input_shape=input_shape))
-    
-    # Convolutional layers.
-    model.add(tf.keras.layers.Conv2D(16, (3, 3), activation='relu'))
-    model.add(tf.keras.layers.MaxPooling2D())
-    model.add(tf.keras.layers.Conv2D(32, (3, 3), activation='relu'))
-    model.add(tf.keras.layers.MaxPooling2D())
-    model.add(tf.keras.layers.Conv2D(64, (3, 3), activation='relu'))
-    model.add(tf.keras.layers.MaxPooling2D())
-    
-    # Fully connected layers.
-    model.add(tf.keras.layers.Flatten())
-    model.add(tf.keras.layers.Dense(128, activation='relu'))
-    model.add(tf.keras.layers.Dense(num_classes, activation='softmax'))
-    
+    base_model = tf.keras.applications.MobileNetV3Small(
+        input_shape=input_shape,
+        include_top=False,
+        weights='imagenet',
+        include_preprocessing=False
+    )
+    base_model.trainable = False
+
+    model = tf.keras.Sequential([
+        base_model,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        # Keep the output in float32 so softmax stays numerically stable under mixed precision.
+        tf.keras.layers.Dense(num_classes, activation='softmax', dtype='float32')
+    ])
     return model
 
 def plot_training_history(history):
@@ -76,43 +113,77 @@ def plot_training_history(history):
     plt.title('Training and Validation Accuracy')
     plt.show()
 
+def export_int8_tflite(model, representative_ds: tf.data.Dataset, output_path: str,
+                       num_calibration_images: int = 200):
+    """
+    Converts a trained float32 Keras model to a fully int8-quantized TFLite model for inference.
+    representative_ds should yield preprocessed (images, labels) batches and is used to calibrate
+    activation ranges.
+    """
+    def representative_dataset():
+        for images, _ in representative_ds.unbatch().batch(1).take(num_calibration_images):
+            yield [tf.cast(images, tf.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    pathlib.Path(output_path).write_bytes(converter.convert())
+
 def main():
+    # Use mixed precision on GPUs so convolutions and matmuls run on Tensor Cores.
+    use_mixed_precision = bool(tf.config.list_physical_devices('GPU'))
+    if use_mixed_precision:
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+
+    # Replicate the model across all visible GPUs.
+    strategy = tf.distribute.MirroredStrategy()
+    print("Number of replicas:", strategy.num_replicas_in_sync)
+
     # Hyperparameters and dataset configuration.
-    data_dir = "/dataset"
-    batch_size = 32
+    # Run convert_to_tfrecord.py first; the image size must match the one used there.
+    tfrecord_dir = "/dataset_tfrecord"
+    # Each replica gets 32 images per step.
+    batch_size = 32 * strategy.num_replicas_in_sync
     img_height = 224
     img_width = 224
-    validation_split = 0.2
-    seed = 123
 
     # Load datasets.
-    train_ds, val_ds = get_datasets(data_dir, img_height, img_width, batch_size,
-                                    validation_split, seed)
-    class_names = train_ds.class_names
+    train_ds, val_ds, class_names = get_datasets(tfrecord_dir)
     num_classes = len(class_names)
     print("Detected classes:", class_names)
 
-    # Optimize the datasets.
-    train_ds = configure_dataset(train_ds, shuffle=True)
-    val_ds = configure_dataset(val_ds, shuffle=False)
-
-    # Define data augmentation layers.
+    # Define data augmentation layers. They run in the tf.data pipeline on the CPU,
+    # so they stay in float32 rather than following the mixed precision policy.
     data_augmentation = tf.keras.Sequential([
-        tf.keras.layers.RandomFlip("horizontal_and_vertical"),
-        tf.keras.layers.RandomRotation(0.2)
+        tf.keras.layers.RandomFlip("horizontal_and_vertical", dtype='float32'),
+        tf.keras.layers.RandomRotation(0.2, dtype='float32')
     ])
 
-    # Build and compile the model.
+    # Optimize the datasets.
+    parse_batch = make_batch_parser(img_height, img_width)
+    train_ds = configure_dataset(train_ds, batch_size, parse_batch, shuffle=True,
+                                 data_augmentation=data_augmentation)
+    val_ds = configure_dataset(val_ds, batch_size, parse_batch, shuffle=False)
+
+    # Build and compile the model inside the strategy scope so its variables are mirrored.
     input_shape = (img_height, img_width, 3)
-    model = build_model(input_shape, num_classes, data_augmentation)
-    model.compile(optimizer='adam',
-                  loss='sparse_categorical_crossentropy',
-                  metrics=['accuracy'])
+    with strategy.scope():
+        model = build_model(input_shape, num_classes)
+        optimizer = tf.keras.optimizers.Adam()
+        if use_mixed_precision:
+            optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+        # jit_compile lets XLA fuse consecutive layers into fewer kernels.
+        model.compile(optimizer=optimizer,
+                      loss='sparse_categorical_crossentropy',
+                      metrics=['accuracy'],
+                      jit_compile=True)
     
     # Callbacks: early stopping and model checkpointing.
     callbacks = [
         tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
-        tf.keras.callbacks.ModelCheckpoint(filepath='best_damage_model.h5', monitor='val_loss', save_best_only=True)
+        tf.keras.callbacks.ModelCheckpoint(filepath='best_damage_model.keras', monitor='val_loss', save_best_only=True)
     ]
     
     # Train the model.
@@ -128,7 +199,15 @@ def main():
     plot_training_history(history)
     
     # Save the final model.
-    model.save("damage_assessment_model_final.h5")
+    model.save("damage_assessment_model_final.keras")
+
+    # Export an int8 TFLite model for inference. Quantization needs a plain float32 graph,
+    # so rebuild the model under a float32 policy, outside the strategy scope to avoid
+    # mirrored variables, and copy the trained weights over.
+    tf.keras.mixed_precision.set_global_policy('float32')
+    export_model = build_model(input_shape, num_classes)
+    export_model.set_weights(model.get_weights())
+    export_int8_tflite(export_model, val_ds, "best_damage_model_int8.tflite")
 
 if __name__ == "__main__":
     main()
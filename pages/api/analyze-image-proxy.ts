@@ -14,10 +14,11 @@ interface ErrorResponse {
  * This avoids CORS issues by making the request to Google Vision API directly
  */
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
-  // Add CORS headers
-  res.setHeader('Access-Control-Allow-Origin', '*');
+  // Add CORS headers - explicit origin instead of a wildcard, and let browsers cache preflights
+  res.setHeader('Access-Control-Allow-Origin', process.env.CORS_ORIGIN || 'https://suresight.vercel.app');
   res.setHeader('Access-Control-Allow-Methods', 'POST, OPTIONS');
   res.setHeader('Access-Control-Allow-Headers', 'Content-Type, Authorization');
+  res.setHeader('Access-Control-Max-Age', '86400');
   
   // Handle preflight requests first
   if (req.method === 'OPTIONS') {